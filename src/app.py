@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 import sys
+import subprocess
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
@@ -25,15 +26,82 @@ if not os.getenv("PINECONE_API_KEY"):
 # Import our modules
 try:
     from embeddings.embeddings import get_embeddings
-    from retrieval.pinecone_retriever import init_pinecone, get_or_create_index
-    from llm.ollama_llm import get_ollama_llm
-    from utils.document_processor import load_pdf_documents, split_documents
-    from utils.qa_chain import answer_question
+    from retrieval.pinecone_retriever import get_index, store_embeddings
+    from llm.ollama_llm import get_llm, warm_up_llm
+    from utils.document_processor import load_and_split_documents
+    from utils.qa_chain import QA_SYSTEM_PROMPT, stream_answer_question, get_token_encoding
+    from utils.query_cache import QueryCache
 except ImportError as e:
     st.error(f"⚠️ Error importing modules: {str(e)}")
     st.error("Please make sure you've installed all required dependencies with 'pip install -r requirements.txt'")
     st.stop()
 
+# Heavy components are cached per worker process, so reruns and new sessions reuse them
+@st.cache_resource(show_spinner=False)
+def _cached_embeddings(cache_dir):
+    return get_embeddings(cache_dir=cache_dir)
+
+@st.cache_resource(show_spinner=False)
+def _cached_query_cache(pdf_files):
+    # Shared by all sessions, and rebuilt when the indexed PDFs change
+    return QueryCache()
+
+@st.cache_resource(show_spinner=False)
+def _cached_index_documents(data_dir, cache_dir, pdf_files):
+    # pdf_files is part of the cache key so adding or removing a PDF re-indexes the documents.
+    # Vector ids are deterministic, so only chunks missing from the index are embedded.
+    # Chunks are streamed from the PDFs into Pinecone, only the chunk count is kept in memory.
+    text_chunks = load_and_split_documents(data_dir, cache_dir=cache_dir)
+    return store_embeddings(get_index(), text_chunks, _cached_embeddings(cache_dir))
+
+# Listing Ollama models spawns a process, reuse the result across reruns for a minute
+@st.cache_data(ttl=60, show_spinner=False)
+def _list_ollama_models():
+    result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
+    if result.returncode != 0:
+        return False, []
+    models = result.stdout.strip().split('\n')[1:]  # Skip header
+    return True, [model.split()[0] for model in models if model.strip()]
+
+# Scanning the data directory can be slow on network drives, reuse the listing across reruns
+@st.cache_data(ttl=30, show_spinner=False)
+def _list_pdf_files(data_dir):
+    if not os.path.exists(data_dir):
+        return []
+    with os.scandir(data_dir) as entries:
+        return [entry.name for entry in entries if entry.name.lower().endswith('.pdf') and entry.is_file()]
+
+# Only the most recent messages are rendered, so long chats don't slow down every rerun
+MAX_RENDERED_MESSAGES = 50
+
+def render_message_html(message):
+    """Render a chat message and its sources to HTML"""
+    # Escape HTML to prevent formatting issues
+    content = html.escape(message["content"])
+    if message["role"] == "user":
+        return f'<div class="chat-message user"><div><strong>You</strong></div><div class="message-content">{content}</div></div>'
+    
+    source_html = ""
+    sources = message.get("sources", [])
+    if sources:
+        source_html = '<div class="source-box"><div class="source-title">Sources:</div><ul>'
+        for source in sources:
+            # Escape HTML in sources
+            safe_source = html.escape(source)
+            source_html += f'<li>{safe_source}</li>'
+        source_html += '</ul></div>'
+    
+    return f'<div class="chat-message bot"><div><strong>Medical Assistant</strong></div><div class="message-content">{content}</div>{source_html}</div>'
+
+def add_message(role, content, sources=None):
+    """Append a message to the chat history, rendering its HTML once"""
+    message = {"role": role, "content": content}
+    if sources:
+        message["sources"] = sources
+    message["_html"] = render_message_html(message)
+    st.session_state.messages.append(message)
+    return message
+
 # Set page configuration
 st.set_page_config(
     page_title="Medical Chatbot",
@@ -137,16 +205,14 @@ st.markdown("""
 
 # Initialize session state for chat history
 if "messages" not in st.session_state:
-    st.session_state.messages = [
-        {"role": "assistant", "content": "Hello! I'm your medical assistant. I can answer questions based only on the uploaded medical PDF documents. My knowledge is limited to the information contained in these documents. How can I help you today?"}
-    ]
+    st.session_state.messages = []
+    add_message("assistant", "Hello! I'm your medical assistant. I can answer questions based only on the uploaded medical PDF documents. My knowledge is limited to the information contained in these documents. How can I help you today?")
 
 # Initialize session state for components
 if "initialized" not in st.session_state:
     st.session_state.initialized = False
     st.session_state.embeddings = None
     st.session_state.index = None
-    st.session_state.text_chunks = None
     st.session_state.llm = None
     st.session_state.initialization_error = None
 
@@ -159,12 +225,9 @@ st.markdown("<div style='font-size: 0.8rem; margin-top: 0.5rem;'>Created by <a h
 
 # Check if Ollama is running
 try:
-    import subprocess
-    result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-    if result.returncode == 0:
-        models = result.stdout.strip().split('\n')[1:]  # Skip header
-        if models and any(line.strip() for line in models):
-            model_names = [model.split()[0] for model in models if model.strip()]
+    ollama_running, model_names = _list_ollama_models()
+    if ollama_running:
+        if model_names:
             st.markdown(f"✅ **Using Ollama with models:** {', '.join(model_names)}")
         else:
             st.warning("⚠️ No Ollama models found. Please pull a model with 'ollama pull llama3.2'")
@@ -183,6 +246,7 @@ else:
 
 # Check for data directory and PDF files
 data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
 if not os.path.exists(data_dir):
     st.warning(f"⚠️ Data directory not found at {data_dir}. Creating it now.")
     try:
@@ -191,7 +255,7 @@ if not os.path.exists(data_dir):
     except Exception as e:
         st.error(f"❌ Error creating data directory: {str(e)}")
 
-pdf_files = [f for f in os.listdir(data_dir) if f.lower().endswith('.pdf')] if os.path.exists(data_dir) else []
+pdf_files = _list_pdf_files(data_dir)
 if not pdf_files:
     st.warning("⚠️ No PDF files found in the data directory. Please add some PDF files to get started.")
     st.markdown(f"""
@@ -212,28 +276,29 @@ if not st.session_state.initialized and pdf_files:
         # Initialize embeddings
         logger.info("Initializing embeddings...")
         progress_placeholder.info("Initializing embeddings... (1/4)")
-        st.session_state.embeddings = get_embeddings()
+        st.session_state.embeddings = _cached_embeddings(cache_dir)
         
         # Initialize Pinecone
         logger.info("Initializing Pinecone...")
         progress_placeholder.info("Connecting to Pinecone... (2/4)")
-        pc = init_pinecone()
-        st.session_state.index = get_or_create_index(pc)
+        st.session_state.index = get_index()
         
         # Initialize LLM
         logger.info("Initializing LLM...")
         progress_placeholder.info("Loading language model... (3/4)")
-        st.session_state.llm = get_ollama_llm()
+        st.session_state.llm = get_llm()
+        warm_up_llm(st.session_state.llm, QA_SYSTEM_PROMPT)
+        # Load the prompt tokenizer now, tiktoken downloads it on first use
+        get_token_encoding()
         
-        # Load and process documents
+        # Load, process and index documents
         logger.info(f"Loading documents from {data_dir}...")
-        progress_placeholder.info(f"Processing documents... (4/4)")
-        documents = load_pdf_documents(data_dir)
-        st.session_state.text_chunks = split_documents(documents)
+        progress_placeholder.info(f"Processing and indexing documents... (4/4)")
+        chunk_count = _cached_index_documents(data_dir, cache_dir, tuple(sorted(pdf_files)))
         
         st.session_state.initialized = True
-        logger.info(f"Initialization complete. Loaded {len(st.session_state.text_chunks)} text chunks.")
-        progress_placeholder.success(f"✅ Ready! Loaded {len(st.session_state.text_chunks)} text chunks from {len(pdf_files)} PDF files.")
+        logger.info(f"Initialization complete. Loaded {chunk_count} text chunks.")
+        progress_placeholder.success(f"✅ Ready! Loaded {chunk_count} text chunks from {len(pdf_files)} PDF files.")
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Error initializing components: {error_msg}")
@@ -262,27 +327,12 @@ st.subheader("Chat")
 # Create a container for chat messages with fixed height for scrolling
 chat_container = st.container()
 with chat_container:
-    # Display chat messages
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            # Escape HTML to prevent formatting issues
-            content = html.escape(message["content"])
-            st.markdown(f'<div class="chat-message user"><div><strong>You</strong></div><div class="message-content">{content}</div></div>', unsafe_allow_html=True)
-        else:
-            # Escape HTML to prevent formatting issues
-            content = html.escape(message["content"])
-            sources = message.get("sources", [])
-            
-            source_html = ""
-            if sources:
-                source_html = '<div class="source-box"><div class="source-title">Sources:</div><ul>'
-                for source in sources:
-                    # Escape HTML in sources
-                    safe_source = html.escape(source)
-                    source_html += f'<li>{safe_source}</li>'
-                source_html += '</ul></div>'
-            
-            st.markdown(f'<div class="chat-message bot"><div><strong>Medical Assistant</strong></div><div class="message-content">{content}</div>{source_html}</div>', unsafe_allow_html=True)
+    # Display chat messages from their pre-rendered HTML
+    hidden_count = len(st.session_state.messages) - MAX_RENDERED_MESSAGES
+    if hidden_count > 0:
+        st.caption(f"{hidden_count} earlier messages are not shown.")
+    for message in st.session_state.messages[-MAX_RENDERED_MESSAGES:]:
+        st.markdown(message.get("_html") or render_message_html(message), unsafe_allow_html=True)
 
 # Chat input
 if st.session_state.initialized:
@@ -291,64 +341,51 @@ if st.session_state.initialized:
     # Process user input
     if user_input:
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        user_message = add_message("user", user_input)
         
         # Display user message immediately
         with chat_container:
-            # Escape HTML to prevent formatting issues
-            content = html.escape(user_input)
-            st.markdown(f'<div class="chat-message user"><div><strong>You</strong></div><div class="message-content">{content}</div></div>', unsafe_allow_html=True)
+            st.markdown(user_message["_html"], unsafe_allow_html=True)
         
         # Generate response
-        with st.spinner("Searching medical literature..."):
-            try:
-                result = answer_question(
+        try:
+            query_cache = _cached_query_cache(tuple(sorted(pdf_files)))
+            
+            with chat_container:
+                answer_placeholder = st.empty()
+            
+            with st.spinner("Searching medical literature..."):
+                answer_stream, texts, _ = stream_answer_question(
                     user_input,
                     st.session_state.index,
                     st.session_state.embeddings,
-                    st.session_state.text_chunks,
-                    st.session_state.llm
+                    st.session_state.llm,
+                    cache=query_cache
                 )
+            
+            # Stream the answer as it is generated
+            with answer_placeholder.container():
+                answer = st.write_stream(answer_stream)
+            
+            # Format sources
+            sources = [text[:100] + "..." for text in texts]
+            
+            # Add assistant message to chat
+            assistant_message = add_message("assistant", answer, sources)
+            
+            # Replace the streamed text with the formatted assistant message
+            answer_placeholder.markdown(assistant_message["_html"], unsafe_allow_html=True)
                 
-                # Format sources
-                sources = [doc.page_content[:100] + "..." for doc in result["source_documents"]]
-                
-                # Add assistant message to chat
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": result["result"],
-                    "sources": sources
-                })
-                
-                # Display assistant message
-                with chat_container:
-                    # Escape HTML to prevent formatting issues
-                    content = html.escape(result["result"])
-                    
-                    source_html = ""
-                    if sources:
-                        source_html = '<div class="source-box"><div class="source-title">Sources:</div><ul>'
-                        for source in sources:
-                            # Escape HTML in sources
-                            safe_source = html.escape(source)
-                            source_html += f'<li>{safe_source}</li>'
-                        source_html += '</ul></div>'
-                    
-                    st.markdown(f'<div class="chat-message bot"><div><strong>Medical Assistant</strong></div><div class="message-content">{content}</div>{source_html}</div>', unsafe_allow_html=True)
-                    
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Error generating response: {error_msg}")
-                st.error(f"❌ Error generating response: {error_msg}")
-                
-                if "Connection refused" in error_msg and "ollama" in error_msg.lower():
-                    st.error("It looks like Ollama is not running. Please start Ollama and refresh this page.")
-                
-                # Add error message to chat
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": f"I'm sorry, I encountered an error: {error_msg}"
-                })
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"Error generating response: {error_msg}")
+            st.error(f"❌ Error generating response: {error_msg}")
+            
+            if "Connection refused" in error_msg and "ollama" in error_msg.lower():
+                st.error("It looks like Ollama is not running. Please start Ollama and refresh this page.")
+            
+            # Add error message to chat
+            add_message("assistant", f"I'm sorry, I encountered an error: {error_msg}")
         
         # Rerun to update the UI
         st.rerun()
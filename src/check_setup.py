@@ -60,13 +60,15 @@ def check_dependencies():
         "langchain",
         "langchain_community",
         "langchain_core",
+        "langchain_ollama",
         "pinecone",
         "sentence_transformers",
         "streamlit",
         "ollama",
         "torch",
         "transformers",
-        "pypdf",
+        "pymupdf",
+        "tiktoken",
         "dotenv",
         "tqdm",
         "pydantic"
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with an int8 quantized ONNX export of a HuggingFace model
+
+    The model is exported and dynamically quantized on first use, then loaded from
+    `model_dir` on later runs. Embeddings are mean pooled and normalized to unit
+    length, matching the SentenceTransformer output of the same model.
+    """
+
+    def __init__(self, model_name, model_dir, batch_size=64, max_length=256):
+        """
+        Args:
+            model_name (str): Name of the HuggingFace model to export
+            model_dir (str): Directory where the quantized model is stored
+            batch_size (int): Number of texts encoded per forward pass
+            max_length (int): Maximum number of tokens per text
+        """
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        if not os.path.exists(os.path.join(model_dir, QUANTIZED_FILE_NAME)):
+            # Export to ONNX and quantize the weights to int8
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+            quantizer = ORTQuantizer.from_pretrained(model_dir)
+            quantizer.quantize(
+                save_dir=model_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            )
+
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=QUANTIZED_FILE_NAME)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _encode(self, texts):
+        """
+        Encode a batch of texts into normalized, mean pooled embeddings
+
+        Args:
+            texts (list): Texts to encode
+
+        Returns:
+            np.ndarray: Embeddings of shape (len(texts), dimension)
+        """
+        tokens = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        hidden = self.model(**tokens).last_hidden_state
+        mask = tokens["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        # Encode texts sorted by length so each batch pads to similar lengths, as
+        # SentenceTransformer does, then put the vectors back in input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start+self.batch_size]
+            for i, vector in zip(batch, self._encode([texts[i] for i in batch]).tolist()):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
@@ -1,8 +1,38 @@
-from langchain_community.llms import Ollama
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import httpx
+from langchain_core.messages import SystemMessage
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_ollama import ChatOllama
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Connection pool shared by all requests to the Ollama server, so each call reuses
+# a kept-alive connection instead of opening a new one
+OLLAMA_CLIENT_KWARGS = {
+    "limits": httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+    "timeout": httpx.Timeout(300.0, connect=10.0),
+}
+
+# Background threads for model load requests, so they overlap with retrieval
+_PRELOAD_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ollama-preload")
+
+class SystemPromptChatOllama(ChatOllama):
+    """
+    ChatOllama that prepends a default system prompt to inputs that don't have one,
+    so plain string prompts keep working with `invoke` and `stream`
+    """
+    system_prompt: Optional[str] = None
+
+    def _convert_input(self, input):
+        prompt_value = super()._convert_input(input)
+        messages = prompt_value.to_messages()
+        if self.system_prompt and not any(isinstance(m, SystemMessage) for m in messages):
+            return ChatPromptValue(messages=[SystemMessage(content=self.system_prompt), *messages])
+        return prompt_value
+
 def get_ollama_llm(
     model_name="llama3.2", 
     temperature=0.3,  # Lower temperature for more factual responses
@@ -13,7 +43,9 @@ def get_ollama_llm(
     system_prompt=None # Optional system prompt
 ):
     """
-    Initialize and return an Ollama LLM optimized for medical question answering
+    Initialize and return an Ollama chat model optimized for medical question answering
+    
+    The model supports `stream()` so answers can be rendered token by token.
     
     Args:
         model_name (str): Name of the Ollama model to use
@@ -25,7 +57,7 @@ def get_ollama_llm(
         system_prompt (str): Optional system prompt to guide the model's behavior
         
     Returns:
-        Ollama: The initialized Ollama LLM
+        SystemPromptChatOllama: The initialized Ollama chat model
     """
     # Default system prompt for medical question answering if none provided
     if system_prompt is None:
@@ -33,15 +65,82 @@ def get_ollama_llm(
     
     logger.info(f"Initializing Ollama with model: {model_name}")
     
-    # Create the Ollama LLM instance
-    llm = Ollama(
+    # Create the Ollama chat model instance
+    llm = SystemPromptChatOllama(
         model=model_name,
         temperature=temperature,
         num_predict=num_predict,
         top_k=top_k,
         top_p=top_p,
         repeat_penalty=repeat_penalty,
-        system=system_prompt
+        system_prompt=system_prompt,
+        client_kwargs=OLLAMA_CLIENT_KWARGS
     )
     
-    return llm 
\ No newline at end of file
+    return llm
+
+@lru_cache(maxsize=1)
+def get_llm():
+    """
+    Get the Ollama chat model shared by the whole process
+    
+    The model and its pooled HTTP client are created on the first call, so every
+    request reuses the same kept-alive connections.
+    
+    Returns:
+        SystemPromptChatOllama: The default Ollama chat model
+    """
+    return get_ollama_llm()
+
+def warm_up_llm(llm, system_prompt=None):
+    """
+    Generate a single token so Ollama loads the model weights before the first question
+    
+    When `system_prompt` is given it is sent as the system message, so Ollama also
+    caches its prefill and the first real request only processes its own tokens.
+    Warming up is only an optimization, so failures are logged and not raised.
+    
+    Args:
+        llm (SystemPromptChatOllama): The Ollama chat model to warm up
+        system_prompt (str): Optional system prompt of the requests that will follow
+    """
+    # Keep the context size of the real requests, changing it would make Ollama reload the model
+    options = {"num_predict": 1}
+    if llm.num_ctx is not None:
+        options["num_ctx"] = llm.num_ctx
+    
+    logger.info(f"Warming up Ollama model: {llm.model}")
+    messages = "ok" if system_prompt is None else [("system", system_prompt), ("human", "ok")]
+    try:
+        llm.invoke(messages, options=options)
+    except Exception as e:
+        logger.warning(f"Could not warm up Ollama model {llm.model}: {e}")
+
+
+def preload_llm(llm):
+    """
+    Ask Ollama to load the model in the background without generating anything
+    
+    Ollama unloads idle models after their keep-alive expires. Calling this when a
+    question arrives lets the model load while the question is embedded and
+    Pinecone is queried; the generation request then simply waits for the load
+    already in progress. Nothing is done for models that are not served by Ollama.
+    
+    Args:
+        llm: The chat model that will answer the question
+        
+    Returns:
+        Future: Completes once the model is loaded, or None if nothing was sent
+    """
+    if not isinstance(llm, ChatOllama):
+        return None
+    return _PRELOAD_EXECUTOR.submit(_load_model, llm)
+
+def _load_model(llm):
+    # An empty message list only loads the model, keep the context size of the real
+    # requests so the model isn't reloaded for them
+    options = {"num_ctx": llm.num_ctx} if llm.num_ctx is not None else None
+    try:
+        llm._client.chat(model=llm.model, messages=[], keep_alive=llm.keep_alive, options=options)
+    except Exception as e:
+        logger.warning(f"Could not preload Ollama model {llm.model}: {e}")
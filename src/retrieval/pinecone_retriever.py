@@ -1,11 +1,34 @@
 import os
+import json
+import hashlib
+import logging
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import quote
 from dotenv import load_dotenv
 from pinecone import Pinecone
 from tqdm.auto import tqdm
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
+# Pinecone rejects upsert requests above 4 MiB and 1000 records, keep some headroom
+MAX_UPSERT_BYTES = int(3.5 * 1024 * 1024)
+MAX_UPSERT_VECTORS = 1000
+
+# Pinecone deletes at most 1000 ids per request
+DELETE_BATCH_SIZE = 1000
+
+# Decimals kept for vector values sent to Pinecone. For unit length embeddings this
+# moves dot products by well under 1e-3, and halves the size of the JSON payload
+VECTOR_DECIMALS = 4
+
+# Approximate size of one rounded float once serialized to JSON by the REST client
+JSON_BYTES_PER_VALUE = 10
+
 def init_pinecone():
     """
     Initialize Pinecone client
@@ -23,14 +46,20 @@ def init_pinecone():
     pc = Pinecone(api_key=PINECONE_API_KEY)
     return pc
 
-def get_or_create_index(pc, index_name="medical-chatbot", dimension=384):
+def get_or_create_index(pc, index_name="medical-chatbot", dimension=384, metric="dotproduct", pool_threads=30):
     """
     Get or create a Pinecone index
     
+    Embeddings are normalized to unit length when they are computed, so the dot
+    product ranks results exactly like cosine similarity without normalizing
+    vectors on every query.
+    
     Args:
         pc (Pinecone): Pinecone client
         index_name (str): Name of the index
         dimension (int): Dimension of the embeddings
+        metric (str): Distance metric used when the index is created
+        pool_threads (int): Number of threads used for asynchronous requests
         
     Returns:
         Index: Pinecone index
@@ -43,7 +72,7 @@ def get_or_create_index(pc, index_name="medical-chatbot", dimension=384):
         pc.create_index(
             name=index_name,
             dimension=dimension,
-            metric="cosine",
+            metric=metric,
             spec=ServerlessSpec(
                 cloud="aws",
                 region="us-east-1"
@@ -51,40 +80,311 @@ def get_or_create_index(pc, index_name="medical-chatbot", dimension=384):
         )
 
     # Connect to the index
-    index = pc.Index(index_name)
+    index = pc.Index(index_name, pool_threads=pool_threads)
     return index
 
-def store_embeddings(index, text_chunks, embeddings, batch_size=100):
+@lru_cache(maxsize=1)
+def get_index(index_name="medical-chatbot"):
+    """
+    Get the Pinecone index shared by the whole process
+    
+    The client and its connection pool are created on the first call and reused
+    afterwards, so requests never pay for a new client or TLS handshake.
+    
+    Args:
+        index_name (str): Name of the index
+        
+    Returns:
+        Index: Pinecone index
+    """
+    return get_or_create_index(init_pinecone(), index_name)
+
+def store_embeddings(index, text_chunks, embeddings, batch_size=1024, max_request_bytes=MAX_UPSERT_BYTES, max_in_flight=10):
     """
     Store embeddings in Pinecone
     
+    Upserts are sent asynchronously over the index's thread pool, with at most
+    `max_in_flight` requests outstanding to avoid being throttled by Pinecone.
+    Vectors are packed into requests by size rather than count so that large
+    metadata never pushes a request over Pinecone's message limit. Vector ids are
+    derived from each chunk's source, position and text and prefixed by the source,
+    so the ids already stored for a source are listed without downloading any
+    vectors, chunks that are already in the index are skipped without being embedded
+    again, and vectors of a source that this ingestion no longer produces, left by
+    an older version of the file or of the chunking, are deleted.
+    
+    Each batch is handed to the embeddings model in a single call, so it is
+    tokenized in bulk by the fast tokenizer and length-sorted across the whole
+    batch, which keeps padding low in the model's own forward passes.
+    
+    `text_chunks` is consumed as a stream: only one batch of chunks and their
+    embeddings is held in memory at a time.
+    
+    Args:
+        index: Pinecone index
+        text_chunks: Iterable of text chunks
+        embeddings: Embeddings model
+        batch_size (int): Number of chunks embedded per call to the embeddings model
+        max_request_bytes (int): Maximum estimated size of a single upsert request
+        max_in_flight (int): Maximum number of concurrent upsert requests
+        
+    Chunks that still can't be embedded one at a time are left out and reported
+    with a warning. A batch in which no chunk at all can be embedded raises.
+    
+    Returns:
+        int: Number of chunks in the index, including the ones already there,
+            excluding the ones that could not be embedded
+    
+    Raises:
+        RuntimeError: If none of the chunks of a batch could be embedded
+    """
+    print(f"Processing chunks in batches of size {batch_size}")
+
+    stats = {"chunks": 0, "skipped": 0, "failed": 0, "deleted": 0}
+    vectors = _iter_vectors(index, text_chunks, embeddings, batch_size, stats)
+
+    pending = deque()
+    for request in _batch_by_size(vectors, max_request_bytes):
+        # Submit the upserts without waiting for the previous ones to finish
+        if len(pending) >= max_in_flight:
+            pending.popleft().get()
+        pending.append(index.upsert(vectors=request, async_req=True))
+
+    # Wait for the remaining upserts and surface any errors
+    while pending:
+        pending.popleft().get()
+
+    if stats["skipped"]:
+        print(f"Skipped {stats['skipped']} chunks that are already in the index")
+    if stats["deleted"]:
+        print(f"Deleted {stats['deleted']} outdated chunks from the index")
+    if stats["failed"]:
+        logger.warning(f"{stats['failed']} of {stats['chunks']} chunks could not be embedded and were not stored")
+    else:
+        print(f"Successfully stored all embeddings in Pinecone index: {index.name}")
+    return stats["chunks"] - stats["failed"]
+
+def iter_chunk_ids(text_chunks):
+    """
+    Compute deterministic vector ids for text chunks
+    
+    The id is the chunk's source prefix (see `source_id_prefix`) followed by a hash
+    of its page, index within that page and text, so re-running ingestion on the
+    same documents produces the same ids, while a chunk whose text changed, for
+    example after a change to the loader or the chunking settings, gets a new id.
+    
+    Args:
+        text_chunks: Iterable of text chunks
+        
+    Yields:
+        tuple: (id, chunk) for each chunk
+    """
+    page_counts = {}
+    for chunk in text_chunks:
+        source = os.path.basename(chunk.metadata.get("source", ""))
+        page = chunk.metadata.get("page", 0)
+        chunk_idx = page_counts.get((source, page), 0)
+        page_counts[(source, page)] = chunk_idx + 1
+        text_hash = hashlib.sha1(chunk.page_content.encode()).hexdigest()
+        chunk_hash = hashlib.sha1(f"{page}:{chunk_idx}:{text_hash}".encode()).hexdigest()[:32]
+        yield f"{source_id_prefix(source)}{chunk_hash}", chunk
+
+def source_id_prefix(source):
+    """
+    Get the prefix shared by the vector ids of every chunk of a source file
+    
+    The file name is percent-encoded, so the prefix is ASCII and a '#' in a file
+    name can't make the prefix of one file match the ids of another.
+    
+    Args:
+        source (str): File name of the source
+        
+    Returns:
+        str: The id prefix
+    """
+    return f"{quote(source, safe='')}#"
+
+def round_vector(values, decimals=VECTOR_DECIMALS):
+    """
+    Round vector values before they are sent to Pinecone
+    
+    Pinecone serverless indexes only accept float32 dense vectors, so the values
+    are shortened instead: the REST client serializes every float as JSON text,
+    and a rounded value takes a fraction of the bytes of a full float repr.
+    
+    Args:
+        values: Vector values
+        decimals (int): Number of decimals to keep
+        
+    Returns:
+        list: The rounded values
+    """
+    return [round(float(value), decimals) for value in values]
+
+def _chunk_metadata(chunk):
+    """
+    Build the Pinecone metadata stored alongside a chunk's vector
+    
+    Args:
+        chunk: Text chunk
+        
+    Returns:
+        dict: Source file, page and text of the chunk
+    """
+    return {
+        "source": os.path.basename(chunk.metadata.get("source", "")),
+        "page": chunk.metadata.get("page", 0),
+        "text": chunk.page_content
+    }
+
+def _iter_vectors(index, text_chunks, embeddings, batch_size, stats):
+    """
+    Embed text chunks batch by batch and yield them as Pinecone vectors
+    
+    Chunks whose id is already present in the index are skipped. The ids stored
+    for a source are listed the first time one of its chunks is seen, and once
+    every chunk has been seen, the listed ids that weren't produced again are
+    deleted from the index.
+    
     Args:
         index: Pinecone index
-        text_chunks: List of text chunks
+        text_chunks: Iterable of text chunks
         embeddings: Embeddings model
-        batch_size (int): Batch size for processing
+        batch_size (int): Number of chunks embedded per call to the embeddings model
+        stats (dict): Updated with the number of chunks seen, skipped, not embedded and deleted
+        
+    Yields:
+        tuple: (id, values, metadata) vector ready to be upserted
+    """
+    chunks_with_ids = iter_chunk_ids(text_chunks)
+    existing = set()
+    listed_prefixes = set()
+    produced = set()
+
+    with tqdm(unit="chunk") as progress:
+        while True:
+            # Get the next batch and drop the chunks that are already indexed
+            batch = list(islice(chunks_with_ids, batch_size))
+            if not batch:
+                break
+            for chunk_id, _ in batch:
+                prefix = chunk_id[:chunk_id.index("#") + 1]
+                if prefix not in listed_prefixes:
+                    listed_prefixes.add(prefix)
+                    existing.update(_list_ids(index, prefix))
+                produced.add(chunk_id)
+            new_batch = [(chunk_id, chunk) for chunk_id, chunk in batch if chunk_id not in existing]
+            stats["chunks"] += len(batch)
+            stats["skipped"] += len(batch) - len(new_batch)
+            progress.update(len(batch))
+            if not new_batch:
+                continue
+            
+            # Embed the whole batch in a single call
+            texts = [chunk.page_content for _, chunk in new_batch]
+            vecs = _embed_batch(embeddings, texts)
+            for (chunk_id, chunk), v in zip(new_batch, vecs):
+                if v is None:
+                    stats["failed"] += 1
+                else:
+                    yield (chunk_id, round_vector(v), _chunk_metadata(chunk))
+
+    # Every chunk was produced, remove what older ingestions left for these sources
+    stale = list(existing - produced)
+    for i in range(0, len(stale), DELETE_BATCH_SIZE):
+        index.delete(ids=stale[i:i+DELETE_BATCH_SIZE])
+    stats["deleted"] += len(stale)
+
+def _list_ids(index, prefix):
+    """
+    List the ids stored in the index that start with a prefix
+    
+    Only ids are returned by Pinecone, no vector values or metadata.
+    
+    Args:
+        index: Pinecone index
+        prefix (str): Id prefix
+        
+    Returns:
+        set: The matching ids
+    """
+    return {vector_id for page in index.list(prefix=prefix) for vector_id in page}
+
+def _estimate_vector_bytes(vector):
+    """
+    Estimate the serialized size of a vector in an upsert request
+    
+    Args:
+        vector (tuple): (id, values) or (id, values, metadata)
         
     Returns:
-        None
+        int: Estimated size in bytes
     """
-    # Process in batches
-    total_batches = len(text_chunks) // batch_size + (1 if len(text_chunks) % batch_size != 0 else 0)
-    print(f"Processing {len(text_chunks)} chunks in {total_batches} batches of size {batch_size}")
+    size = len(vector[0]) + len(vector[1]) * JSON_BYTES_PER_VALUE
+    if len(vector) > 2 and vector[2]:
+        size += len(json.dumps(vector[2]))
+    return size
 
-    for i in tqdm(range(0, len(text_chunks), batch_size)):
-        # Get the current batch
-        batch = text_chunks[i:i+batch_size]
+def _batch_by_size(vectors, max_bytes=MAX_UPSERT_BYTES, max_count=MAX_UPSERT_VECTORS):
+    """
+    Pack vectors into upsert requests that stay under Pinecone's size limits
+    
+    Args:
+        vectors: Iterable of vectors
+        max_bytes (int): Maximum estimated size of a request
+        max_count (int): Maximum number of vectors in a request
         
-        # Create vectors for the current batch
-        vectors = [
-            (str(i+j), embeddings.embed_query(t.page_content)) 
-            for j, t in enumerate(batch)
-        ]
+    Yields:
+        list: Vectors for a single upsert request
+    """
+    batch = []
+    batch_bytes = 0
+    for vector in vectors:
+        vector_bytes = _estimate_vector_bytes(vector)
+        if batch and (batch_bytes + vector_bytes > max_bytes or len(batch) >= max_count):
+            logger.debug(f"Flushing upsert of {len(batch)} vectors (~{batch_bytes} bytes)")
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(vector)
+        batch_bytes += vector_bytes
+
+    if batch:
+        logger.debug(f"Flushing upsert of {len(batch)} vectors (~{batch_bytes} bytes)")
+        yield batch
+
+def _embed_batch(embeddings, texts):
+    """
+    Embed a batch of texts, falling back to one text at a time if the batch fails
+    
+    Args:
+        embeddings: Embeddings model
+        texts (list): Texts to embed
         
-        # Upsert the current batch
-        index.upsert(vectors=vectors)
+    Returns:
+        list: One embedding per text, or None for texts that could not be embedded
+    
+    Raises:
+        RuntimeError: If none of the texts could be embedded
+    """
+    try:
+        return embeddings.embed_documents(texts)
+    except Exception as e:
+        logger.warning(f"Batch embedding failed ({e}), retrying {len(texts)} chunks individually")
+
+    vecs = []
+    error = None
+    for text in texts:
+        try:
+            vecs.append(embeddings.embed_documents([text])[0])
+        except Exception as e:
+            logger.warning(f"Skipping chunk that could not be embedded: {e}")
+            vecs.append(None)
+            error = e
 
-    print(f"Successfully stored all embeddings in Pinecone index: {index.name}")
+    if all(v is None for v in vecs):
+        raise RuntimeError(f"Could not embed any of {len(texts)} chunks") from error
+    return vecs
 
 def query_pinecone(index, query_embedding, top_k=2, include_metadata=True):
     """
@@ -100,7 +400,7 @@ def query_pinecone(index, query_embedding, top_k=2, include_metadata=True):
         dict: Query results
     """
     results = index.query(
-        vector=query_embedding,
+        vector=round_vector(query_embedding),
         top_k=top_k,
         include_metadata=include_metadata
     )
@@ -1,41 +1,154 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+import os
+import glob
+import pickle
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from tqdm.auto import tqdm
+from transformers import AutoTokenizer
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def load_pdf_documents(data_dir):
+# PyMuPDF extracts text in C, several times faster than the pure Python pypdf
+PDF_LOADER_CLS = PyMuPDFLoader
+
+# Chunks are measured with the embedding model's own tokenizer. MiniLM reads at most
+# 256 tokens including [CLS] and [SEP], so a 254 token chunk fills its window exactly
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_SIZE = 254
+CHUNK_OVERLAP = 32
+
+def _list_pdf_paths(data_dir):
+    with os.scandir(data_dir) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.is_file() and entry.name.lower().endswith(".pdf")
+        )
+
+def _load_pdf(path):
+    # Runs in a worker process, PyMuPDF is not thread safe and holds the GIL while parsing
+    return PDF_LOADER_CLS(path).load()
+
+def load_pdf_documents(data_dir, max_concurrency=None):
     """
-    Load PDF documents from a directory
+    Lazily load PDF documents from a directory, parsing several files in parallel
+    
+    Each file is parsed in a separate worker process, since PyMuPDF can't be used
+    from several threads of one process. Pages are yielded file by file in a
+    stable order. At most `max_concurrency` parsed files are held in memory at
+    once, so the corpus is never fully loaded.
     
     Args:
         data_dir (str): Path to the directory containing PDF files
+        max_concurrency (int): Maximum number of PDFs parsed at once, defaults to min(8, CPU count)
         
-    Returns:
-        list: List of loaded documents
-    """
-    loader = DirectoryLoader(
-        data_dir,
-        glob="*.pdf",
-        loader_cls=PyPDFLoader,
-        recursive=False,
-        show_progress=True
+    Yields:
+        Document: One document per PDF page
+    """
+    if max_concurrency is None:
+        max_concurrency = min(8, os.cpu_count() or 1)
+    
+    paths = _list_pdf_paths(data_dir)
+    with ProcessPoolExecutor(max_workers=max_concurrency) as executor, tqdm(total=len(paths)) as progress:
+        pending = deque()
+        for path in paths:
+            if len(pending) >= max_concurrency:
+                yield from pending.popleft().result()
+                progress.update()
+            pending.append(executor.submit(_load_pdf, path))
+        
+        while pending:
+            yield from pending.popleft().result()
+            progress.update()
+
+@lru_cache(maxsize=None)
+def _get_tokenizer(tokenizer_name):
+    return AutoTokenizer.from_pretrained(tokenizer_name)
+
+def split_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, tokenizer_name=TOKENIZER_NAME):
+    """
+    Lazily split documents into chunks measured in tokens of the embedding model
+    
+    Args:
+        documents: Iterable of documents
+        chunk_size (int): Size of each chunk in tokens
+        chunk_overlap (int): Overlap between chunks in tokens
+        tokenizer_name (str): Name of the HuggingFace tokenizer used to count tokens
+        
+    Yields:
+        Document: Text chunks, in the order of the input documents
+    """
+    text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        _get_tokenizer(tokenizer_name),
+        chunk_size=chunk_size, 
+        chunk_overlap=chunk_overlap
     )
-    documents = loader.load()
-    return documents
+    for document in documents:
+        yield from text_splitter.split_documents([document])
 
-def split_documents(documents, chunk_size=500, chunk_overlap=20):
+def _chunk_cache_key(data_dir, chunk_size, chunk_overlap):
     """
-    Split documents into chunks
+    Compute a cache key from the PDF files in a directory and the chunking settings
     
     Args:
-        documents (list): List of documents
+        data_dir (str): Path to the directory containing PDF files
         chunk_size (int): Size of each chunk
         chunk_overlap (int): Overlap between chunks
         
     Returns:
-        list: List of text chunks
+        str: Hex digest that changes whenever a PDF is added, removed or modified
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, 
-        chunk_overlap=chunk_overlap
-    )
-    chunks = text_splitter.split_documents(documents)
-    return chunks 
\ No newline at end of file
+    h = hashlib.sha1(f"{PDF_LOADER_CLS.__name__}:{TOKENIZER_NAME}:{chunk_size}:{chunk_overlap}".encode())
+    for entry in sorted(os.scandir(data_dir), key=lambda e: e.name):
+        if entry.is_file() and entry.name.lower().endswith(".pdf"):
+            stat = entry.stat()
+            h.update(f"|{entry.name}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return h.hexdigest()
+
+def load_and_split_documents(data_dir, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, cache_dir=None):
+    """
+    Lazily load and split PDF documents, reusing chunks cached on disk when the PDFs are unchanged
+    
+    Chunks are streamed from the PDFs (or the cache) one at a time, and written to
+    the cache as they are produced.
+    
+    Args:
+        data_dir (str): Path to the directory containing PDF files
+        chunk_size (int): Size of each chunk in tokens
+        chunk_overlap (int): Overlap between chunks in tokens
+        cache_dir (str): Directory where chunks are cached, caching is disabled if None
+        
+    Yields:
+        Document: Text chunks
+    """
+    if cache_dir is None:
+        yield from split_documents(load_pdf_documents(data_dir), chunk_size, chunk_overlap)
+        return
+
+    key = _chunk_cache_key(data_dir, chunk_size, chunk_overlap)
+    cache_path = os.path.join(cache_dir, f"chunks_{key}.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    # Replace any cache written for a previous version of the PDFs
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale_path in glob.glob(os.path.join(cache_dir, "chunks_*.pkl")):
+        os.remove(stale_path)
+
+    # Only publish the cache once every chunk has been written
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in split_documents(load_pdf_documents(data_dir), chunk_size, chunk_overlap):
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield chunk
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,89 +1,630 @@
+import asyncio
+import logging
+from functools import lru_cache
+import numpy as np
+import tiktoken
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
+from retrieval.pinecone_retriever import round_vector, get_index
+from llm.ollama_llm import preload_llm, get_llm
 
-def get_qa_prompt():
+logger = logging.getLogger(__name__)
+
+# Static instructions sent as the system message of every QA request. They are the
+# same for every question, so Ollama reuses their cached prefill from the previous
+# request and only processes the question and context
+QA_SYSTEM_PROMPT = """You are a knowledgeable medical assistant providing accurate information based on medical literature. 
+Your task is to answer the user's question using ONLY the provided context information.
+
+Guidelines:
+- Base your answer EXCLUSIVELY on the information in the context provided below
+- If the context doesn't contain enough information to answer the question fully, acknowledge the limitations
+- If you don't know the answer based on the context, simply say "I don't have enough information to answer this question"
+- Be concise but thorough in your explanations
+- Use medical terminology appropriately but explain complex terms
+- Format your answer in clear, complete sentences with proper paragraphs
+- Use bullet points only when listing multiple items
+- Ensure your response has a logical flow and is easy to read
+- Do NOT include any information that is not supported by the context
+- Do NOT make up or infer information beyond what is explicitly stated in the context
+- Do NOT reference the context directly in your answer (e.g., don't say "According to the context...")
+"""
+
+# Template of the question part of a QA request. Only the question and context
+# change between requests, the instructions are sent separately as QA_SYSTEM_PROMPT
+QA_TEMPLATE = """Question: {question}
+
+Context:
+{context}
+
+Answer:
+"""
+
+# Bound str.format of the template, fills the prompt in a single C call without
+# going through PromptTemplate's input validation on every question
+_format_qa_prompt = QA_TEMPLATE.format
+
+# Token window of a QA request and the tokens kept free for the answer when the
+# LLM doesn't set num_ctx or num_predict, Ollama's default window and the
+# num_predict of get_ollama_llm. The chat template adds a few header tokens
+# around every message on top of the prompt text
+LLM_CONTEXT_TOKENS = 2048
+ANSWER_TOKENS = 512
+CHAT_TEMPLATE_TOKENS = 16
+
+# Average number of characters per token, used to estimate lengths when the
+# tokenizer can't be loaded
+CHARS_PER_TOKEN = 4
+
+# Number of characters of normalized text compared to spot repeated chunks
+DEDUP_PREFIX_CHARS = 128
+
+# Number of candidates fetched from Pinecone and reranked locally with maximal
+# marginal relevance, and the weight of relevance against diversity in the rerank
+FETCH_K = 20
+MMR_LAMBDA = 0.5
+
+# Number of characters of chunk text included in the sources of a result
+SOURCE_PREVIEW_CHARS = 200
+
+@lru_cache(maxsize=1)
+def get_token_encoding():
     """
-    Get the prompt template for QA
+    Get the tokenizer used to measure prompt lengths
+    
+    Llama 3 models use a BPE vocabulary built on top of cl100k_base, so its
+    counts are close to the ones of the model served by Ollama. tiktoken downloads
+    the vocabulary on first use and caches it locally, call this at startup so the
+    download doesn't happen while answering a question.
     
     Returns:
-        PromptTemplate: The prompt template
+        tiktoken.Encoding: The cl100k_base encoding, or None if it can't be loaded,
+            lengths are then estimated from the number of characters
     """
-    template = """
-    You are a knowledgeable medical assistant providing accurate information based on medical literature. 
-    Your task is to answer the user's question using ONLY the provided context information.
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load the cl100k_base tokenizer, estimating token counts: {e}")
+        return None
 
-    Guidelines:
-    - Base your answer EXCLUSIVELY on the information in the context provided below
-    - If the context doesn't contain enough information to answer the question fully, acknowledge the limitations
-    - If you don't know the answer based on the context, simply say "I don't have enough information to answer this question"
-    - Be concise but thorough in your explanations
-    - Use medical terminology appropriately but explain complex terms
-    - Format your answer in clear, complete sentences with proper paragraphs
-    - Use bullet points only when listing multiple items
-    - Ensure your response has a logical flow and is easy to read
-    - Do NOT include any information that is not supported by the context
-    - Do NOT make up or infer information beyond what is explicitly stated in the context
-    - Do NOT reference the context directly in your answer (e.g., don't say "According to the context...")
+def _count_tokens(text):
+    encoding = get_token_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    # Chunk text is plain document text, special token markers in it are not special
+    return len(encoding.encode(text, disallowed_special=()))
 
-    Question: {question}
+def _truncate_tokens(text, max_tokens):
+    """
+    Truncate a text to a number of tokens
+    
+    Args:
+        text (str): The text to truncate
+        max_tokens (int): Maximum number of tokens to keep
+        
+    Returns:
+        tuple: (text, token_count) of the truncated text
+    """
+    encoding = get_token_encoding()
+    if encoding is None:
+        text = text[:max_tokens * CHARS_PER_TOKEN]
+        return text, _count_tokens(text)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) > max_tokens:
+        return encoding.decode(tokens[:max_tokens]), max_tokens
+    return text, len(tokens)
 
-    Context:
-    {context}
+@lru_cache(maxsize=1)
+def get_static_prompt_tokens():
+    """
+    Count the tokens of the parts of the prompt that never change
+    
+    This is the system prompt and the question template without its fields. They
+    are tokenized once per process instead of on every question.
+    
+    Returns:
+        int: Number of static prompt tokens
+    """
+    return (
+        _count_tokens(QA_SYSTEM_PROMPT)
+        + _count_tokens(_format_qa_prompt(question="", context=""))
+        + CHAT_TEMPLATE_TOKENS
+    )
 
-    Answer:
+def get_context_budget(question, llm=None):
     """
+    Get the number of tokens left for the retrieved context of a question
     
+    The token window and answer length are read from the LLM's `num_ctx` and
+    `num_predict`, falling back to LLM_CONTEXT_TOKENS and ANSWER_TOKENS when unset.
+    
+    Args:
+        question (str): The question to answer
+        llm: Language model that will answer the question
+        
+    Returns:
+        int: Tokens left once the static prompt, the question and the answer are counted
+    """
+    context_tokens = getattr(llm, "num_ctx", None) or LLM_CONTEXT_TOKENS
+    # Ollama uses negative values of num_predict for unbounded answers
+    answer_tokens = getattr(llm, "num_predict", None)
+    if answer_tokens is None or answer_tokens <= 0:
+        answer_tokens = ANSWER_TOKENS
+    question_tokens = _count_tokens(question)
+    return context_tokens - answer_tokens - get_static_prompt_tokens() - question_tokens
+
+@lru_cache(maxsize=1)
+def get_qa_prompt():
+    """
+    Get the prompt template for the question part of a QA request
+    
+    build_prompt formats QA_TEMPLATE directly, this is kept for callers that
+    compose LangChain chains. The template is static, so it is built once.
+    
+    Returns:
+        PromptTemplate: The prompt template
+    """
     prompt = PromptTemplate(
-        template=template,
+        template=QA_TEMPLATE,
         input_variables=["question", "context"]
     )
     
     return prompt
 
-def answer_question(question, index, embeddings, text_chunks, llm, k=3):
+def embed_question(question, embeddings, cache=None):
     """
-    Answer a question using the retrieval-based QA system
+    Embed a question, through the query cache when one is given
+    
+    Args:
+        question (str): The question to embed
+        embeddings: Embeddings model
+        cache (QueryCache): Optional cache of query embeddings and answers
+        
+    Returns:
+        list: The query embedding
+    """
+    if cache is None:
+        return embeddings.embed_query(question)
+    return cache.embed_query(embeddings, question)
+
+def embed_questions(questions, embeddings, cache=None):
+    """
+    Embed several questions in one batch, through the query cache when one is given
+    
+    Args:
+        questions (list): The questions to embed
+        embeddings: Embeddings model
+        cache (QueryCache): Optional cache of query embeddings and answers
+        
+    Returns:
+        list: One query embedding per question, in the same order
+    """
+    if cache is None:
+        return embeddings.embed_documents(questions)
+    return cache.embed_queries(embeddings, questions)
+
+def retrieve_chunks(question, index, embeddings, k=3, query_embedding=None, fetch_k=FETCH_K, mmr_lambda=MMR_LAMBDA):
+    """
+    Retrieve the text of the chunks most relevant to a question
+    
+    The chunk text is read from the Pinecone metadata stored at ingestion time.
+    Texts and metadata are returned as two parallel lists, so building the prompt
+    only touches plain strings. When `fetch_k` is larger than `k`, that many
+    candidates are fetched with their vectors and `k` of them are picked with
+    maximal marginal relevance, so near-identical chunks don't crowd out the rest.
     
     Args:
         question (str): The question to answer
         index: Pinecone index
         embeddings: Embeddings model
-        text_chunks: List of text chunks
-        llm: Language model
-        k (int): Number of documents to retrieve (increased from 2 to 3 for better context)
+        k (int): Number of documents to retrieve
+        query_embedding (list): Embedding of the question, computed if None
+        fetch_k (int): Number of candidates to rerank, reranking is skipped if not above k
+        mmr_lambda (float): Weight of relevance against diversity, between 0 and 1
         
     Returns:
-        dict: Result containing the answer and source documents
+        tuple: (texts, metadatas) of the retrieved chunks
     """
     # Convert query to embedding
-    query_embedding = embeddings.embed_query(question)
+    if query_embedding is None:
+        query_embedding = embeddings.embed_query(question)
     
     # Query Pinecone
+    rerank = fetch_k > k
     results = index.query(
-        vector=query_embedding,
-        top_k=k,
-        include_metadata=True
+        vector=round_vector(query_embedding),
+        top_k=fetch_k if rerank else k,
+        include_metadata=True,
+        include_values=rerank
     )
     
-    # Get the documents
-    documents = []
-    for match in results['matches']:
-        doc_id = int(match['id'])
-        if 0 <= doc_id < len(text_chunks):
-            documents.append(text_chunks[doc_id])
+    # Get the chunks from the text stored in the vector metadata, without the
+    # repeated ones so the same passage isn't paid for twice in the prompt.
+    # Vectors left over from older indexes may have no text, they are skipped
+    matches = [match for match in results['matches'] if (match.get('metadata') or {}).get('text')]
+    matches = _unique_matches(matches)
+    if rerank and len(matches) > k:
+        selected = _mmr_select(query_embedding, [match['values'] for match in matches], k, mmr_lambda)
+        matches = [matches[i] for i in selected]
+    texts = [match['metadata']['text'] for match in matches]
+    metadatas = [
+        {
+            "id": match['id'],
+            "score": match['score'],
+            "source": match['metadata'].get('source'),
+            "page": match['metadata'].get('page')
+        }
+        for match in matches
+    ]
+    
+    return texts, metadatas
+
+def _unique_matches(matches):
+    """
+    Drop matches that repeat an earlier one
+    
+    A match is a repeat if it has the same id, or if its text starts the same as
+    an earlier match once case and whitespace are normalized, as happens when the
+    same passage appears in several documents.
+    
+    Args:
+        matches (list): Pinecone matches, most relevant first
+        
+    Returns:
+        list: The matches that are not repeats, in the same order
+    """
+    seen_ids = set()
+    seen_prefixes = set()
+    unique = []
+    for match in matches:
+        prefix = " ".join(match['metadata']['text'].lower().split())[:DEDUP_PREFIX_CHARS]
+        if match['id'] in seen_ids or prefix in seen_prefixes:
+            continue
+        seen_ids.add(match['id'])
+        seen_prefixes.add(prefix)
+        unique.append(match)
+    return unique
+
+def _mmr_select(query_embedding, vectors, k, mmr_lambda):
+    """
+    Pick vectors by maximal marginal relevance
+    
+    Each step picks the candidate with the best trade-off between similarity to
+    the query and dissimilarity to the candidates already picked. Vectors are unit
+    length, so every similarity is a dot product computed up front.
+    
+    Args:
+        query_embedding (list): Embedding of the question
+        vectors (list): Candidate vectors
+        k (int): Number of vectors to pick
+        mmr_lambda (float): Weight of relevance against diversity, between 0 and 1
+        
+    Returns:
+        list: Indices of the picked vectors, in the order they were picked
+    """
+    candidates = np.asarray(vectors, dtype=np.float32)
+    query_similarity = candidates @ np.asarray(query_embedding, dtype=np.float32)
+    pair_similarity = candidates @ candidates.T
+    
+    selected = [int(np.argmax(query_similarity))]
+    max_similarity = pair_similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = mmr_lambda * query_similarity - (1 - mmr_lambda) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, pair_similarity[best], out=max_similarity)
+    return selected
+
+def retrieve_documents(question, index, embeddings, k=3, query_embedding=None):
+    """
+    Retrieve the text chunks most relevant to a question as documents
+    
+    Args:
+        question (str): The question to answer
+        index: Pinecone index
+        embeddings: Embeddings model
+        k (int): Number of documents to retrieve
+        query_embedding (list): Embedding of the question, computed if None
+        
+    Returns:
+        list: The retrieved documents
+    """
+    texts, metadatas = retrieve_chunks(question, index, embeddings, k, query_embedding)
+    return [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+
+def fit_context(question, texts, metadatas, max_context_tokens=None, llm=None):
+    """
+    Fit the retrieved chunks into the token budget of the prompt context
+    
+    Each chunk gets a share of the budget proportional to its similarity score,
+    read from its metadata. Tokens a short chunk doesn't use are shared between
+    the chunks after it, so the whole budget is available to the chunks that need
+    it. Chunks left without any tokens are dropped from all three returned lists,
+    so the sources of an answer are exactly the chunks the LLM was shown.
+    
+    Args:
+        question (str): The question to answer
+        texts (list): Text of the retrieved chunks, most relevant first
+        metadatas (list): Metadata of the retrieved chunks
+        max_context_tokens (int): Maximum number of tokens of context, whatever
+            is left of the LLM's token window if None
+        llm: Language model the prompt is built for, sets the token window
+        
+    Returns:
+        tuple: (contexts, texts, metadatas), the truncated texts to put in the
+            prompt and the full texts and metadata of the chunks kept
+    """
+    if max_context_tokens is None:
+        max_context_tokens = get_context_budget(question, llm)
+    
+    scores = [metadata.get("score") for metadata in metadatas]
+    weights = [max(score, 0.0) if score is not None else 1.0 for score in scores]
+    if not any(weights):
+        weights = [1.0] * len(texts)
+    remaining_weight = sum(weights)
+    
+    contexts, kept_texts, kept_metadatas = [], [], []
+    for text, metadata, weight in zip(texts, metadatas, weights):
+        quota = int(max_context_tokens * weight / remaining_weight) if remaining_weight > 0 else 0
+        remaining_weight -= weight
+        if quota <= 0:
+            continue
+        context, used = _truncate_tokens(text, quota)
+        contexts.append(context)
+        kept_texts.append(text)
+        kept_metadatas.append(metadata)
+        max_context_tokens -= used
+    return contexts, kept_texts, kept_metadatas
+
+def build_prompt(question, texts):
+    """
+    Build the LLM messages for a question from the retrieved chunk texts
+    
+    The system message is always QA_SYSTEM_PROMPT, so every request starts with
+    the same tokens and their prefill is cached by the Ollama server. The texts
+    are used as they are, fit them to the token window with fit_context first.
     
-    # Create context from documents
-    context = "\n\n".join([doc.page_content for doc in documents])
+    Args:
+        question (str): The question to answer
+        texts (list): Text of the retrieved chunks
+        
+    Returns:
+        list: (role, content) chat messages
+    """
+    # Create context from the chunk texts
+    context = "\n\n".join(texts)
     
     # Create prompt
-    prompt = get_qa_prompt().format(
-        question=question,
-        context=context
+    prompt = _format_qa_prompt(question=question, context=context)
+    
+    return [("system", QA_SYSTEM_PROMPT), ("human", prompt)]
+
+def build_result(answer, texts, metadatas, return_documents=False):
+    """
+    Build the result returned for an answered question
+    
+    Sources are small dicts with the vector id and the start of the chunk text,
+    cheap to serialize. The full LangChain documents are only added on request.
+    
+    Args:
+        answer (str): The generated answer
+        texts (list): Text of the retrieved chunks
+        metadatas (list): Metadata of the retrieved chunks
+        return_documents (bool): Whether to include the full source documents
+        
+    Returns:
+        dict: Result containing the answer, the sources and, if requested, the
+            source documents
+    """
+    result = {
+        "result": answer,
+        "sources": [
+            {"id": metadata.get("id"), "preview": text[:SOURCE_PREVIEW_CHARS]}
+            for text, metadata in zip(texts, metadatas)
+        ]
+    }
+    if return_documents:
+        result["source_documents"] = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+    return result
+
+def _select_result(result, return_documents):
+    # Cached and new results hold the source documents, drop them if not requested
+    if return_documents:
+        return result
+    return {"result": result["result"], "sources": result["sources"]}
+
+def _resolve_clients(index, llm):
+    # Fall back to the process-wide clients, so callers never build one per request
+    return (get_index() if index is None else index), (get_llm() if llm is None else llm)
+
+def stream_answer_question(question, index, embeddings, llm, k=3, cache=None):
+    """
+    Answer a question, streaming the answer as the LLM generates it
+    
+    Retrieval runs before this returns, the LLM is only called as the returned
+    stream is consumed, so the caller can show the first tokens as soon as they
+    are generated. When a cache is given, a cached answer is streamed in one piece
+    without querying Pinecone or the LLM, and an answer streamed to the end is
+    added to the cache. On a cache miss the LLM is asked to load its model in the
+    background first, so a model unloaded while idle loads during retrieval
+    instead of after it.
+    
+    Args:
+        question (str): The question to answer
+        index: Pinecone index
+        embeddings: Embeddings model
+        llm: Language model
+        k (int): Number of documents to retrieve
+        cache (QueryCache): Optional cache of query embeddings and answers
+        
+    Returns:
+        tuple: (answer_stream, texts, metadatas), where answer_stream yields the
+            answer text piece by piece
+    """
+    query_embedding = embed_question(question, embeddings, cache)
+    if cache is not None:
+        cached = cache.get_answer(question, query_embedding)
+        if cached is not None:
+            texts = [doc.page_content for doc in cached["source_documents"]]
+            metadatas = [doc.metadata for doc in cached["source_documents"]]
+            return iter((cached["result"],)), texts, metadatas
+    
+    index, llm = _resolve_clients(index, llm)
+    preload_llm(llm)
+    texts, metadatas = retrieve_chunks(question, index, embeddings, k, query_embedding)
+    contexts, texts, metadatas = fit_context(question, texts, metadatas, llm=llm)
+    prompt = build_prompt(question, contexts)
+    
+    def answer_stream():
+        # Get answer from LLM
+        pieces = []
+        for chunk in llm.stream(prompt):
+            pieces.append(chunk.content)
+            yield chunk.content
+        
+        if cache is not None:
+            cache.put_answer(
+                question, query_embedding, build_result("".join(pieces), texts, metadatas, return_documents=True)
+            )
+    
+    return answer_stream(), texts, metadatas
+
+def answer_question(question, index, embeddings, llm, k=3, cache=None, return_documents=False):
+    """
+    Answer a question using the retrieval-based QA system
+    
+    Collects the streamed answer of stream_answer_question, for callers that need
+    the complete result at once. Pass None as `index` or `llm` to use the
+    process-wide clients, rather than creating new ones for each request.
+    
+    Args:
+        question (str): The question to answer
+        index: Pinecone index, the shared one from get_index() if None
+        embeddings: Embeddings model
+        llm: Language model, the shared one from get_llm() if None
+        k (int): Number of documents to retrieve (increased from 2 to 3 for better context)
+        cache (QueryCache): Optional cache of query embeddings and answers
+        return_documents (bool): Whether to include the full source documents
+        
+    Returns:
+        dict: Result containing the answer and sources
+    """
+    answer_stream, texts, metadatas = stream_answer_question(question, index, embeddings, llm, k, cache)
+    return build_result("".join(answer_stream), texts, metadatas, return_documents)
+
+async def aanswer_question(question, index, embeddings, llm, k=3, cache=None, return_documents=False):
+    """
+    Answer a question without blocking the event loop
+    
+    Embedding and the Pinecone query run in worker threads and the LLM is called
+    through its async API, so many questions can be in flight at once.
+    
+    Args:
+        question (str): The question to answer
+        index: Pinecone index
+        embeddings: Embeddings model
+        llm: Language model
+        k (int): Number of documents to retrieve
+        cache (QueryCache): Optional cache of query embeddings and answers
+        return_documents (bool): Whether to include the full source documents
+        
+    Returns:
+        dict: Result containing the answer and sources
+    """
+    query_embedding = await asyncio.to_thread(embed_question, question, embeddings, cache)
+    if cache is not None:
+        cached = cache.get_answer(question, query_embedding)
+        if cached is not None:
+            return _select_result(cached, return_documents)
+    
+    index, llm = _resolve_clients(index, llm)
+    preload_llm(llm)
+    texts, metadatas = await asyncio.to_thread(
+        retrieve_chunks, question, index, embeddings, k, query_embedding
     )
+    contexts, texts, metadatas = fit_context(question, texts, metadatas, llm=llm)
+    prompt = build_prompt(question, contexts)
     
     # Get answer from LLM
-    answer = llm.invoke(prompt)
+    answer = (await llm.ainvoke(prompt)).content
     
-    return {
-        "result": answer,
-        "source_documents": documents
-    } 
\ No newline at end of file
+    result = build_result(answer, texts, metadatas, return_documents=True)
+    if cache is not None:
+        cache.put_answer(question, query_embedding, result)
+    
+    return _select_result(result, return_documents)
+
+async def aanswer_questions(questions, index, embeddings, llm, k=3, cache=None, return_documents=False):
+    """
+    Answer several questions concurrently
+    
+    Duplicate questions are answered once. The questions without a cached
+    embedding are embedded in a single batched call, then the Pinecone queries
+    and LLM calls run concurrently.
+    
+    Args:
+        questions (list): The questions to answer
+        index: Pinecone index
+        embeddings: Embeddings model
+        llm: Language model
+        k (int): Number of documents to retrieve per question
+        cache (QueryCache): Optional cache of query embeddings and answers
+        return_documents (bool): Whether to include the full source documents
+        
+    Returns:
+        list: One result per question, in the same order
+    """
+    unique_questions = list(dict.fromkeys(questions))
+    query_embeddings = await asyncio.to_thread(embed_questions, unique_questions, embeddings, cache)
+    
+    results = {}
+    pending = []
+    for question, query_embedding in zip(unique_questions, query_embeddings):
+        cached = cache.get_answer(question, query_embedding) if cache is not None else None
+        if cached is not None:
+            results[question] = cached
+        else:
+            pending.append((question, query_embedding))
+    
+    if pending:
+        index, llm = _resolve_clients(index, llm)
+        preload_llm(llm)
+    chunks = await asyncio.gather(*[
+        asyncio.to_thread(retrieve_chunks, question, index, embeddings, k, query_embedding)
+        for question, query_embedding in pending
+    ])
+    fitted = [
+        fit_context(question, texts, metadatas, llm=llm)
+        for (question, _), (texts, metadatas) in zip(pending, chunks)
+    ]
+    prompts = [build_prompt(question, contexts) for (question, _), (contexts, _, _) in zip(pending, fitted)]
+    answers = await llm.abatch(prompts) if prompts else []
+    
+    for (question, query_embedding), (_, texts, metadatas), answer in zip(pending, fitted, answers):
+        results[question] = build_result(answer.content, texts, metadatas, return_documents=True)
+        if cache is not None:
+            cache.put_answer(question, query_embedding, results[question])
+    
+    return [_select_result(results[question], return_documents) for question in questions]
+
+def answer_questions(questions, index, embeddings, llm, k=3, cache=None, return_documents=False):
+    """
+    Answer several questions concurrently from synchronous code
+    
+    Args:
+        questions (list): The questions to answer
+        index: Pinecone index
+        embeddings: Embeddings model
+        llm: Language model
+        k (int): Number of documents to retrieve per question
+        cache (QueryCache): Optional cache of query embeddings and answers
+        return_documents (bool): Whether to include the full source documents
+        
+    Returns:
+        list: One result per question, in the same order
+    """
+    return asyncio.run(aanswer_questions(questions, index, embeddings, llm, k, cache, return_documents))
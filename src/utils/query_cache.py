@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query embeddings and answers, keyed by question
+
+    Answers can optionally also be found by similarity: when `similarity_threshold`
+    is set, a question whose embedding has a cosine similarity of at least that
+    value with a cached question reuses its answer. Embeddings are expected to be
+    normalized, so the similarity is a single matrix-vector product.
+    """
+
+    def __init__(self, maxsize=1024, similarity_threshold=None):
+        """
+        Args:
+            maxsize (int): Maximum number of questions kept for each cache
+            similarity_threshold (float): Minimum similarity for a fuzzy answer hit,
+                fuzzy lookup is disabled if None
+        """
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._embeddings = OrderedDict()
+        # question -> (slot in _matrix, result)
+        self._answers = OrderedDict()
+        self._matrix = None
+        self._slot_questions = [None] * maxsize
+        self._valid = np.zeros(maxsize, dtype=bool)
+        self.embedding_hits = 0
+        self.embedding_misses = 0
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def embed_query(self, embeddings, question):
+        """
+        Embed a question, reusing the embedding of a previously seen identical question
+
+        Args:
+            embeddings: Embeddings model
+            question (str): The question to embed
+
+        Returns:
+            list: The query embedding
+        """
+        with self._lock:
+            if question in self._embeddings:
+                self._embeddings.move_to_end(question)
+                self.embedding_hits += 1
+                return self._embeddings[question]
+            self.embedding_misses += 1
+
+        query_embedding = embeddings.embed_query(question)
+
+        with self._lock:
+            self._embeddings[question] = query_embedding
+            if len(self._embeddings) > self.maxsize:
+                self._embeddings.popitem(last=False)
+        return query_embedding
+
+    def embed_queries(self, embeddings, questions):
+        """
+        Embed several questions, embedding only the ones not seen before in a single batch
+        
+        Args:
+            embeddings: Embeddings model
+            questions (list): The questions to embed
+            
+        Returns:
+            list: One query embedding per question, in the same order
+        """
+        found = {}
+        with self._lock:
+            for question in questions:
+                if question in self._embeddings:
+                    self._embeddings.move_to_end(question)
+                    self.embedding_hits += 1
+                    found[question] = self._embeddings[question]
+            missing = list(dict.fromkeys(q for q in questions if q not in found))
+            self.embedding_misses += len(missing)
+        
+        if missing:
+            new_embeddings = embeddings.embed_documents(missing)
+            with self._lock:
+                for question, query_embedding in zip(missing, new_embeddings):
+                    found[question] = query_embedding
+                    self._embeddings[question] = query_embedding
+                    if len(self._embeddings) > self.maxsize:
+                        self._embeddings.popitem(last=False)
+        
+        return [found[question] for question in questions]
+
+    def get_answer(self, question, query_embedding=None):
+        """
+        Look up the cached answer for a question
+
+        Args:
+            question (str): The question
+            query_embedding (list): Embedding of the question, used for fuzzy lookup
+
+        Returns:
+            dict: The cached result, or None on a miss
+        """
+        with self._lock:
+            if question in self._answers:
+                self._answers.move_to_end(question)
+                self.hits += 1
+                return self._answers[question][1]
+
+            if self.similarity_threshold is not None and query_embedding is not None and self._valid.any():
+                similarities = self._matrix @ np.asarray(query_embedding, dtype=np.float32)
+                similarities[~self._valid] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    similar_question = self._slot_questions[best]
+                    self._answers.move_to_end(similar_question)
+                    self.fuzzy_hits += 1
+                    return self._answers[similar_question][1]
+
+            self.misses += 1
+            return None
+
+    def put_answer(self, question, query_embedding, result):
+        """
+        Cache the answer to a question, evicting the least recently used one when full
+
+        Args:
+            question (str): The question
+            query_embedding (list): Embedding of the question
+            result (dict): The answer to cache
+        """
+        with self._lock:
+            if question in self._answers:
+                slot = self._answers[question][0]
+                self._answers[question] = (slot, result)
+                self._answers.move_to_end(question)
+                return
+
+            if len(self._answers) >= self.maxsize:
+                _, (slot, _) = self._answers.popitem(last=False)
+            else:
+                slot = len(self._answers)
+
+            self._answers[question] = (slot, result)
+            self._slot_questions[slot] = question
+            self._valid[slot] = query_embedding is not None
+            if query_embedding is not None:
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.maxsize, len(query_embedding)), dtype=np.float32)
+                self._matrix[slot] = query_embedding
+
+    def stats(self):
+        """
+        Get the hit and miss counters of the cache
+
+        Returns:
+            dict: Counters for embedding and answer lookups
+        """
+        with self._lock:
+            return {
+                "embedding_hits": self.embedding_hits,
+                "embedding_misses": self.embedding_misses,
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses
+            }